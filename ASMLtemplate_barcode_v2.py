@@ -1,8 +1,13 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import argparse
+import csv
+import functools
 import gdstk
 import math
+import numpy as np
+import pathlib
 import sys
 from datetime import datetime
 from packaging.version import parse as parse_version
@@ -71,103 +76,243 @@ codedict = {
     "+": [nb, ws, nb, ns, nb, ws, nb, ws, nb, ns], "%": [nb, ns, nb, ws, nb, ws, nb, ws, nb, ns],
     " ": [nb, ws, wb, ns, nb, ns, wb, ns, nb, ns]}
 
+ALLOWED_CHARS = frozenset(codedict)
+# Deletes every allowed character, so whatever survives translate() is invalid, in label order.
+_STRIP_ALLOWED = str.maketrans('', '', ''.join(ALLOWED_CHARS))
+
+_STARTSTOP = np.asarray(startstop, dtype=np.float64)
+# Code widths as one contiguous (N, 10) table; each encodable character translates to its row index,
+# so str2code is a single gather.
+_CHAR_INDEX = {char: i for i, char in enumerate(codedict)}
+_WIDTHS_TABLE = np.ascontiguousarray(list(codedict.values()), dtype=np.float64)
+_TRANS = str.maketrans({char: chr(i) for char, i in _CHAR_INDEX.items()})
+
 # --- GDS Cell Creation Functions ---
 
+def _check_barcode_chars(str2wrt):
+    invalid_chars = str2wrt.translate(_STRIP_ALLOWED)
+    if invalid_chars:
+        raise InvalidBarcodeCharacter(invalid_chars[0])
+
 def str2code(str2wrt):
-    barcode = []
-    barcode.extend(startstop)
-    for char in str2wrt:
-        barcode.extend(codedict[char])
-    barcode.extend(startstop)
-    return barcode
+    # translate() passes unknown characters through unchanged, so reject them before they are read as row indices.
+    _check_barcode_chars(str2wrt)
+    idx = np.frombuffer(str2wrt.translate(_TRANS).encode('latin1'), dtype=np.uint8)
+    return np.concatenate([_STARTSTOP, _WIDTHS_TABLE[idx].ravel(), _STARTSTOP])
+
+def _compute_bar_rects(barcode):
+    # Positive widths are bars, negative widths are spaces; bar edges come from the running total of |width|.
+    edges = np.empty(barcode.size + 1, dtype=np.float64)
+    edges[0] = 0.0
+    np.cumsum(np.abs(barcode), out=edges[1:])
+    mask = barcode > 0
+    return edges[:-1][mask], edges[1:][mask]
 
 def barcad(barcode, lib_ref, layer_num, datatype_num=0):
     code_cell = lib_ref.new_cell('BARCODE')
-    xcurr = 0
-    for x in barcode:
-        if x > 0:
-            code_cell.add(gdstk.rectangle((xcurr, -barheight / 2), (xcurr + x, barheight / 2), layer=layer_num, datatype=datatype_num))
-        xcurr += abs(x)
+    x0s, x1s = _compute_bar_rects(np.asarray(barcode, dtype=np.float64))
+    rects = [gdstk.rectangle((xa, -barheight / 2), (xb, barheight / 2), layer=layer_num, datatype=datatype_num)
+             for xa, xb in zip(x0s.tolist(), x1s.tolist())]
+    code_cell.add(*rects)
     return code_cell
 
-def datecad(lib_ref, layer_num, datatype_num=0):
-    date_cell = lib_ref.new_cell('DATE')
-    today_text = gdstk.text(datetime.today().strftime('%Y-%m-%d'), 4 * scale, (0, 0), layer=layer_num, datatype=datatype_num)
-    if today_text:
-        (min_x, min_y), (max_x, max_y) = today_text[0].bounding_box()
-        for poly in today_text[1:]:
-            (bb_min_x, bb_min_y), (bb_max_x, bb_max_y) = poly.bounding_box()
-            min_x, min_y = min(min_x, bb_min_x), min(min_y, bb_min_y)
-            max_x, max_y = max(max_x, bb_max_x), max(max_y, bb_max_y)
-        center_x, center_y = (min_x + max_x) / 2, (min_y + max_y) / 2
-        for poly in today_text:
-            poly.translate(-center_x, -center_y)
-    date_cell.add(*today_text)
-    return date_cell
-
-def humancad(str2wrt, lib_ref, layer_num, datatype_num=0):
-    label_cell = lib_ref.new_cell('RETICLELABEL')
-    text = gdstk.text(str2wrt, 4 * scale, (0, 0), layer=layer_num, datatype=datatype_num)
-    if text:
-        (min_x, min_y), (max_x, max_y) = text[0].bounding_box()
-        for poly in text[1:]:
-            (bb_min_x, bb_min_y), (bb_max_x, bb_max_y) = poly.bounding_box()
-            min_x, min_y = min(min_x, bb_min_x), min(min_y, bb_min_y)
-            max_x, max_y = max(max_x, bb_max_x), max(max_y, bb_max_y)
-        center_x, center_y = (min_x + max_x) / 2, (min_y + max_y) / 2
-        for poly in text:
-            poly.translate(-center_x, -center_y)
-    label_cell.add(*text)
-    return label_cell
+def _center_polygons(polys):
+    if not polys:
+        return
+    all_pts = np.concatenate([poly.points for poly in polys], axis=0)
+    center_x, center_y = (all_pts.min(axis=0) + all_pts.max(axis=0)) / 2
+    for poly in polys:
+        poly.translate(-center_x, -center_y)
 
-# --- Main Execution Block ---
+@functools.lru_cache(maxsize=64)
+def _text_polys(str2wrt, size):
+    # gdstk polygons are mutable, so only the (read-only) vertex arrays are cached.
+    polys = []
+    for poly in gdstk.text(str2wrt, size, (0, 0)):
+        pts = poly.points
+        pts.flags.writeable = False
+        polys.append(pts)
+    return tuple(polys)
 
-if __name__ == "__main__":
-    print("--- ASML Reticle Merge and Barcode Generator ---")
+def text_centered_cell(name, str2wrt, lib_ref, layer_num, datatype_num=0):
+    text_cell = lib_ref.new_cell(name)
+    text = [gdstk.Polygon(pts, layer=layer_num, datatype=datatype_num) for pts in _text_polys(str2wrt, 4 * scale)]
+    _center_polygons(text)
+    text_cell.add(*text)
+    return text_cell
 
+def prompt_gds_path(prompt):
+    # gdstk.read_gds only takes a path (no file objects or mmaps), so check the path before handing it over.
     while True:
-        template_gds_file = input("Enter the name of the ASML template GDS file: ")
-        try:
-            template_lib = gdstk.read_gds(template_gds_file)
-            print(f"Successfully loaded template '{template_gds_file}'.")
-            break
-        except FileNotFoundError:
-            print(f"Error: The file '{template_gds_file}' was not found. Please try again.")
+        gds_file = input(prompt)
+        if pathlib.Path(gds_file).is_file():
+            return gds_file
+        print(f"Error: The file '{gds_file}' was not found. Please try again.")
 
-    while True:
-        user_gds_file = input("Enter the name of your personal design GDS file: ")
-        try:
-            user_lib = gdstk.read_gds(user_gds_file)
-            print(f"Successfully loaded your design '{user_gds_file}'.")
-            break
-        except FileNotFoundError:
-            print(f"Error: The file '{user_gds_file}' was not found. Please try again.")
+# --- Merge Helpers ---
 
-    # --- Layer Conflict Resolution ---
+def validate_barcode(barcode_label):
+    if not 1 <= len(barcode_label) <= 12:
+        raise InvalidBarcodeLength(barcode_label)
+    _check_barcode_chars(barcode_label)
+
+def resolve_layer_conflicts(template_lib, user_lib):
     user_layers_datatypes = user_lib.layers_and_datatypes()
     template_layers_datatypes = template_lib.layers_and_datatypes()
-    
+
     barcode_layer_datatype = (4, 0)
-    all_template_layers_datatypes = template_layers_datatypes.union({barcode_layer_datatype})
-    
-    conflicts = user_layers_datatypes.intersection(all_template_layers_datatypes)
+    conflicts = user_layers_datatypes & template_layers_datatypes
+    if barcode_layer_datatype in user_layers_datatypes:
+        conflicts = conflicts | {barcode_layer_datatype}
 
     if conflicts:
-        user_layers = {layer for layer, dt in user_layers_datatypes}
-        max_user_layer = max(user_layers) if user_layers else 0
+        max_user_layer = max((layer for layer, _ in user_layers_datatypes), default=0)
         new_layer = max_user_layer + 1
         print(f"\n! Layer conflict detected. Conflicting (layer, datatype) pairs: {conflicts}.")
         print(f"  All template and barcode features will be moved to a new, safe layer: {new_layer}")
-        
+
         remap_dict = {
-            old_ld: (new_layer, old_ld[1]) for old_ld in all_template_layers_datatypes
+            old_ld: (new_layer, old_ld[1]) for old_ld in template_layers_datatypes if old_ld[0] != new_layer
         }
         template_lib.remap(remap_dict)
-        
-        barcode_target_layer = new_layer
-    else:
-        print("\nNo layer conflicts detected.")
-        barcode_target_layer = barcode_layer_datatype[0]
+
+        return new_layer
+    print("\nNo layer conflicts detected.")
+    return barcode_layer_datatype[0]
+
+def add_barcode_and_labels(template_lib, design_cell, cell_ref, barcode_label, barcode_target_layer):
+    barcode_cell = barcad(str2code(barcode_label), template_lib, barcode_target_layer)
+    hrc_label_cell = text_centered_cell('RETICLELABEL', barcode_label, template_lib, barcode_target_layer)
+    date_cell = text_centered_cell('DATE', datetime.today().strftime('%Y-%m-%d'), template_lib, barcode_target_layer)
+
+    design_cell.add(
+        cell_ref,
+        gdstk.Reference(barcode_cell, (x0, y - quiet_zone), rotation=-math.pi / 2),
+        gdstk.Reference(hrc_label_cell, (x0_hrc, y2_hrc), rotation=math.pi / 2),
+        gdstk.Reference(date_cell, (x0_hrc, y1_hrc), rotation=math.pi / 2),
+    )
+
+def add_mla_cell(template_lib, design_cell):
+    mla_cell = template_lib.new_cell('for_the_mla')
+    # Add a reference to 'asml_template' that is mirrored and rotated
+    mla_ref = gdstk.Reference(design_cell, rotation=math.pi, x_reflection=True)
+    mla_cell.add(mla_ref)
+    return mla_cell
+
+def copy_library(lib_ref):
+    # Deep-copy every cell and point references at the copies, so per-job remaps and additions leave lib_ref untouched.
+    lib_copy = gdstk.Library(lib_ref.name, unit=lib_ref.unit, precision=lib_ref.precision)
+    cell_map = {cell.name: cell.copy(cell.name, deep_copy=True) for cell in lib_ref.cells}
+    for cell in cell_map.values():
+        for ref in cell.references:
+            if isinstance(ref.cell, gdstk.Cell):
+                ref.cell = cell_map[ref.cell.name]
+    lib_copy.add(*cell_map.values())
+    return lib_copy
+
+BATCH_REQUIRED_COLUMNS = ('user_gds', 'barcode', 'output')
+
+def _batch_field(job, column):
+    # csv.DictReader fills the fields missing from a short row with None.
+    value = (job.get(column) or '').strip()
+    if not value:
+        raise ValueError(f"missing value for required column '{column}'")
+    return value
+
+def _batch_option(job, column, choices, default):
+    value = (job.get(column) or '').strip()
+    if not value:
+        return default
+    if value.lower() not in choices:
+        raise ValueError(f"invalid value '{value}' for column '{column}'; use one of: {', '.join(choices)}")
+    return value.lower()
+
+def run_batch(template_lib, batch_csv, design_cell_name='asml_template'):
+    try:
+        template_lib[design_cell_name]
+    except KeyError:
+        print(f"Error: Template missing required cell '{design_cell_name}'.")
+        return False
+
+    # utf-8-sig drops the byte-order mark Excel writes, which would otherwise end up in the first header.
+    with open(batch_csv, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        missing_columns = [col for col in BATCH_REQUIRED_COLUMNS if col not in (reader.fieldnames or [])]
+        if missing_columns:
+            print(f"Error: '{batch_csv}' is missing required column(s): {', '.join(missing_columns)}.")
+            return False
+        jobs = list(reader)
+
+    n_ok = 0
+    for row_num, job in enumerate(jobs, start=2):
+        print(f"\n--- Batch job {row_num - 1}/{len(jobs)} (line {row_num}) ---")
+        try:
+            barcode_label = _batch_field(job, 'barcode').upper()
+            validate_barcode(barcode_label)
+            output_gds_file = _batch_field(job, 'output')
+            if not output_gds_file.lower().endswith('.gds'):
+                output_gds_file += '.gds'
+            scale_factor = 4.0 if _batch_option(job, 'scale', ['w', 'wafer', 'r', 'reticle'], 'r') in ['w', 'wafer'] else 1.0
+            use_mla = _batch_option(job, 'mla', ['y', 'yes', 'n', 'no'], 'n') in ['y', 'yes']
+
+            user_lib = gdstk.read_gds(_batch_field(job, 'user_gds'))
+            user_top_cells = [cell for cell in user_lib.top_level() if cell.name != '$$$CONTEXT_INFO$$$']
+            cell_name = (job.get('cell') or '').strip()
+            if cell_name:
+                user_top_cells = [cell for cell in user_top_cells if cell.name == cell_name]
+            if len(user_top_cells) != 1:
+                raise ValueError("could not select a single top-level cell; set the 'cell' column")
+            user_cell_to_merge = user_top_cells[0]
+
+            job_lib = copy_library(template_lib)
+            design_cell = job_lib[design_cell_name]
+            barcode_target_layer = resolve_layer_conflicts(job_lib, user_lib)
+            job_lib.add(*user_lib.cells)
+            cell_ref = gdstk.Reference(user_cell_to_merge.name, magnification=scale_factor)
+            add_barcode_and_labels(job_lib, design_cell, cell_ref, barcode_label, barcode_target_layer)
+            if use_mla:
+                add_mla_cell(job_lib, design_cell)
+            job_lib.write_gds(output_gds_file)
+            print(f"Saved '{output_gds_file}' ({user_cell_to_merge.name} at {scale_factor}x, barcode '{barcode_label}').")
+            n_ok += 1
+        except (KeyError, ValueError, OSError, InvalidBarcodeLength, InvalidBarcodeCharacter) as e:
+            print(f"Error: skipping job on line {row_num}: {e}")
+    print(f"\nBatch finished: {n_ok}/{len(jobs)} designs written.")
+    return n_ok == len(jobs)
+
+# --- Main Execution Block ---
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge a design GDS into the ASML reticle template and add a barcode.")
+    parser.add_argument('--batch-csv', help="CSV of jobs (user_gds, barcode, output[, cell, scale, mla]) to run without prompts")
+    parser.add_argument('--template', help="ASML template GDS file (required with --batch-csv)")
+    parser.add_argument('--user-gds', help="your personal design GDS file (skips the prompt)")
+    args = parser.parse_args()
+    for input_file in (args.template, args.user_gds, args.batch_csv):
+        if input_file is not None and not pathlib.Path(input_file).is_file():
+            parser.error(f"the file '{input_file}' was not found")
+
+    if args.batch_csv:
+        if not args.template:
+            parser.error("--batch-csv requires --template")
+        if args.user_gds:
+            parser.error("--user-gds cannot be used with --batch-csv")
+        template_lib = gdstk.read_gds(args.template)
+        print(f"Successfully loaded template '{args.template}'.")
+        sys.exit(0 if run_batch(template_lib, args.batch_csv) else 1)
+
+    print("--- ASML Reticle Merge and Barcode Generator ---")
+
+    template_gds_file = args.template or prompt_gds_path("Enter the name of the ASML template GDS file: ")
+    template_lib = gdstk.read_gds(template_gds_file)
+    print(f"Successfully loaded template '{template_gds_file}'.")
+
+    user_gds_file = args.user_gds or prompt_gds_path("Enter the name of your personal design GDS file: ")
+    user_lib = gdstk.read_gds(user_gds_file)
+    print(f"Successfully loaded your design '{user_gds_file}'.")
+
+    # --- Layer Conflict Resolution ---
+    barcode_target_layer = resolve_layer_conflicts(template_lib, user_lib)
 
     # --- Cell Selection and Merging ---
     user_top_cells = [cell for cell in user_lib.top_level() if cell.name != '$$$CONTEXT_INFO$$$']
@@ -208,27 +353,21 @@ if __name__ == "__main__":
             print("Invalid input. Please enter 'w' or 'r'.")
 
     design_cell_name = 'asml_template'
-    template_cell_names = [c.name for c in template_lib.cells]
-    if design_cell_name not in template_cell_names:
+    try:
+        design_cell = template_lib[design_cell_name]
+    except KeyError:
         print(f"Error: Template missing required cell '{design_cell_name}'.")
         exit()
-    
-    design_cell = template_lib[design_cell_name]
+
     template_lib.add(*user_lib.cells)
     
     cell_ref = gdstk.Reference(user_cell_to_merge.name, magnification=scale_factor)
-    design_cell.add(cell_ref)
-    print(f"Successfully added a {scale_factor}x reference to '{user_cell_to_merge.name}' into '{design_cell_name}'.")
 
     # --- Barcode Input and Creation ---
     while True:
         try:
             barcode_label = input("\nEnter barcode (1-12 alphanumeric characters): ").upper()
-            if not 1 <= len(barcode_label) <= 12:
-                raise InvalidBarcodeLength(barcode_label)
-            if not all(char in codedict for char in barcode_label):
-                invalid_char = next(char for char in barcode_label if char not in codedict)
-                raise InvalidBarcodeCharacter(invalid_char)
+            validate_barcode(barcode_label)
             print(f"Barcode '{barcode_label}' is valid.")
             break
         except (InvalidBarcodeLength, InvalidBarcodeCharacter) as e:
@@ -238,24 +377,16 @@ if __name__ == "__main__":
     if not output_gds_file.lower().endswith('.gds'):
         output_gds_file += '.gds'
 
-    barcode_cell = barcad(str2code(barcode_label), template_lib, barcode_target_layer)
-    hrc_label_cell = humancad(barcode_label, template_lib, barcode_target_layer)
-    date_cell = datecad(template_lib, barcode_target_layer)
-
-    design_cell.add(gdstk.Reference(barcode_cell, (x0, y - quiet_zone), rotation=-math.pi / 2))
-    design_cell.add(gdstk.Reference(hrc_label_cell, (x0_hrc, y2_hrc), rotation=math.pi / 2))
-    design_cell.add(gdstk.Reference(date_cell, (x0_hrc, y1_hrc), rotation=math.pi / 2))
-    print(f"\nBarcode and HRCs added to cell '{design_cell_name}'.")
+    add_barcode_and_labels(template_lib, design_cell, cell_ref, barcode_label, barcode_target_layer)
+    print(f"\nSuccessfully added a {scale_factor}x reference to '{user_cell_to_merge.name}' into '{design_cell_name}'.")
+    print(f"Barcode and HRCs added to cell '{design_cell_name}'.")
 
     # --- Final MLA150 Transformation Step ---
     while True:
         mla_input = input("\nWill this design be fabricated on the Nanolab's MLA150? (y/n): ").lower()
         if mla_input in ['y', 'yes']:
             print("Creating 'for_the_mla' cell with required transformations.")
-            mla_cell = template_lib.new_cell('for_the_mla')
-            # Add a reference to 'asml_template' that is mirrored and rotated
-            mla_ref = gdstk.Reference(design_cell, rotation=math.pi, x_reflection=True)
-            mla_cell.add(mla_ref)
+            add_mla_cell(template_lib, design_cell)
             print("MLA150-specific cell has been created.")
             break
         elif mla_input in ['n', 'no']: